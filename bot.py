@@ -105,6 +105,9 @@ def scan_provider(env_config: dict):
 async def graceful_shutdown():
     try:
         logger.info("正在优雅关闭麦麦...")
+        from src.plugins.PFC.pfc import DirectMessageSender
+
+        await DirectMessageSender.aclose()
         tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
         for task in tasks:
             task.cancel()
@@ -1,12 +1,15 @@
 import time
 import asyncio
 import traceback
-from typing import Optional, Dict, Any, List
+from collections import deque
+from itertools import islice
+from typing import Optional, Dict, Any, List, Deque
 from src.common.logger import get_module_logger
 from ..message.message_base import UserInfo
 from ..config.config import global_config
 from .chat_states import NotificationManager, create_new_message_notification, create_cold_chat_notification
 from .message_storage import MongoDBMessageStorage
+from .pfc_utils import truncate_history, format_hms
 
 logger = get_module_logger("chat_observer")
 
@@ -31,6 +34,17 @@ class ChatObserver:
             cls._instances[stream_id] = cls(stream_id)
         return cls._instances[stream_id]
 
+    @classmethod
+    def remove_instance(cls, stream_id: str):
+        """停止并移除观察器实例，之后再获取时会创建新的实例
+
+        Args:
+            stream_id: 聊天流ID
+        """
+        observer = cls._instances.pop(stream_id, None)
+        if observer is not None:
+            observer.stop()
+
     def __init__(self, stream_id: str):
         """初始化观察器
 
@@ -56,6 +70,9 @@ class ChatObserver:
         self._task: Optional[asyncio.Task] = None
         self._update_event = asyncio.Event()  # 触发更新的事件
         self._update_complete = asyncio.Event()  # 更新完成的事件
+        self._new_message_event = asyncio.Event()  # 有新消息到达的事件
+        self._ready_event = asyncio.Event()  # 启动后完成首次拉取的事件
+        self._update_waiters: List[asyncio.Future] = []  # 等待下一次刷新完成的调用方
 
         # 通知管理器
         self.notification_manager = NotificationManager()
@@ -67,9 +84,17 @@ class ChatObserver:
 
         self.update_event = asyncio.Event()
         self.update_interval = 2  # 更新间隔（秒）
-        self.message_cache = []
+        self.min_refresh_interval = 0.1  # 两次刷新的最小间隔（秒），窗口内的多次触发合并为一次
+        self._last_refresh: float = 0.0
         self.update_running = False
 
+        # 最近到达的消息，按时间从旧到新排列
+        self.message_history: Deque[Dict[str, Any]] = deque(maxlen=200)
+        self.latest_message: Optional[Dict[str, Any]] = None  # 最新的一条消息，每次到达时直接替换
+
+        # 渲染好的聊天记录行，每条消息只在到达时格式化一次，供各个提示词复用
+        self._rendered_lines: Deque[str] = deque(maxlen=200)
+
     async def check(self) -> bool:
         """检查距离上一次观察之后是否有了新消息
 
@@ -93,6 +118,13 @@ class ChatObserver:
             message: 消息数据
         """
         try:
+            # 消息的展示字段只在到达时计算一次，后续渲染和通知处理直接复用
+            message["_time_str"] = format_hms(message["time"])
+            message["_user_info"] = UserInfo.from_dict(message.get("user_info", {}))
+            self._render_message(message)
+            self.message_history.append(message)
+            self.latest_message = message
+
             # 发送新消息通知
             # logger.info(f"发送新ccchandleer消息通知: {message}")
             notification = create_new_message_notification(
@@ -108,6 +140,30 @@ class ChatObserver:
         # 检查并更新冷场状态
         await self._check_cold_chat()
 
+    def _render_message(self, message: Dict[str, Any]):
+        """将消息格式化为一行聊天记录并缓存
+
+        Args:
+            message: 消息数据
+        """
+        user_info = message["_user_info"]
+        sender = user_info.user_nickname or f"用户{user_info.user_id}"
+        if sender == global_config.BOT_NICKNAME:
+            sender = "你说"
+        self._rendered_lines.append(f"{message['_time_str']},{sender}:{message.get('processed_plain_text', '')}")
+
+    def get_rendered_history(self, limit: int = 20, max_chars: int = 1600) -> str:
+        """获取格式化好的聊天记录文本
+
+        Args:
+            limit: 最多包含的消息条数，默认20
+            max_chars: 字数上限，超出时丢弃较早的消息
+
+        Returns:
+            str: 每行一条消息的聊天记录
+        """
+        return "\n".join(truncate_history(list(self._rendered_lines)[-limit:], max_chars))
+
     async def _check_cold_chat(self):
         """检查是否处于冷场状态并发送通知"""
         current_time = time.time()
@@ -149,6 +205,28 @@ class ChatObserver:
         logger.debug(f"判断是否在指定时间点后有新消息: {self.last_message_time} > {time_point} = {has_new}")
         return has_new
 
+    async def wait_new_message(self, time_point: float, timeout: float) -> bool:
+        """等待指定时间点之后的新消息到达
+
+        Args:
+            time_point: 时间戳
+            timeout: 超时时间（秒）
+
+        Returns:
+            bool: 是否等到了新消息（False表示超时）
+        """
+        deadline = time.time() + timeout
+        while not self.new_message_after(time_point):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            self._new_message_event.clear()
+            try:
+                await asyncio.wait_for(self._new_message_event.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return self.new_message_after(time_point)
+        return True
+
     def get_message_history(
         self,
         start_time: Optional[float] = None,
@@ -167,7 +245,7 @@ class ChatObserver:
         Returns:
             List[Dict[str, Any]]: 消息列表
         """
-        filtered_messages = self.message_history
+        filtered_messages = list(self.message_history)
 
         if start_time is not None:
             filtered_messages = [m for m in filtered_messages if m["time"] >= start_time]
@@ -177,7 +255,9 @@ class ChatObserver:
 
         if user_id is not None:
             filtered_messages = [
-                m for m in filtered_messages if UserInfo.from_dict(m.get("user_info", {})).user_id == user_id
+                m
+                for m in filtered_messages
+                if (m.get("_user_info") or UserInfo.from_dict(m.get("user_info", {}))).user_id == user_id
             ]
 
         if limit is not None:
@@ -233,6 +313,7 @@ class ChatObserver:
         #     logger.error(f"缓冲消息出错: {e}")
 
         while self._running:
+            waiters: List[asyncio.Future] = []
             try:
                 # 等待事件或超时（1秒）
                 try:
@@ -243,8 +324,16 @@ class ChatObserver:
                     # print("超时")
                     pass  # 超时后也执行一次检查
 
+                # 距上次刷新过近时稍等片刻，期间到来的触发会被合并到这一次刷新中
+                elapsed = time.monotonic() - self._last_refresh
+                if elapsed < self.min_refresh_interval:
+                    await asyncio.sleep(self.min_refresh_interval - elapsed)
+                self._last_refresh = time.monotonic()
+
                 self._update_event.clear()  # 重置触发事件
                 self._update_complete.clear()  # 重置完成事件
+                # 在此之前登记的等待者都由本次刷新唤醒
+                waiters, self._update_waiters = self._update_waiters, []
 
                 # 获取新消息
                 new_messages = await self._fetch_new_messages()
@@ -253,14 +342,48 @@ class ChatObserver:
                     # 处理新消息
                     for message in new_messages:
                         await self._add_message_to_history(message)
+                    self._new_message_event.set()
 
                 # 设置完成事件
                 self._update_complete.set()
+                self._ready_event.set()
+                self._resolve_waiters(waiters)
 
             except Exception as e:
                 logger.error(f"更新循环出错: {e}")
                 logger.error(traceback.format_exc())
                 self._update_complete.set()  # 即使出错也要设置完成事件
+                self._ready_event.set()
+                self._resolve_waiters(waiters)
+
+    @staticmethod
+    def _resolve_waiters(waiters: List[asyncio.Future]):
+        """唤醒等待刷新完成的调用方，已超时放弃的跳过"""
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def update_now(self, timeout: float = 5.0) -> bool:
+        """立即触发一次更新并等待它完成
+
+        与trigger_update加wait_for_update不同，这里等待的一定是触发之后开始的那次刷新，
+        不会被上一次刷新遗留的完成事件提前唤醒
+
+        Args:
+            timeout: 超时时间（秒）
+
+        Returns:
+            bool: 是否成功完成更新（False表示超时）
+        """
+        waiter = asyncio.get_running_loop().create_future()
+        self._update_waiters.append(waiter)
+        self._update_event.set()
+        try:
+            await asyncio.wait_for(waiter, timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"等待更新完成超时（{timeout}秒）")
+            return False
 
     def trigger_update(self):
         """触发一次立即更新"""
@@ -282,12 +405,30 @@ class ChatObserver:
             logger.warning(f"等待更新完成超时（{timeout}秒）")
             return False
 
+    async def wait_ready(self, timeout: float = 5.0) -> bool:
+        """等待观察器启动后完成首次消息拉取
+
+        Args:
+            timeout: 超时时间（秒）
+
+        Returns:
+            bool: 是否已就绪（False表示超时）
+        """
+        try:
+            await asyncio.wait_for(self._ready_event.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"等待观察器就绪超时（{timeout}秒）")
+            return False
+
     def start(self):
         """启动观察器"""
         if self._running:
             return
 
         self._running = True
+        self._ready_event.clear()
+        self._update_event.set()  # 启动后立即拉取一次，而不是等到首个轮询周期
         self._task = asyncio.create_task(self._update_loop())
         logger.info(f"ChatObserver for {self.stream_id} started")
 
@@ -296,6 +437,9 @@ class ChatObserver:
         self._running = False
         self._update_event.set()  # 设置事件以解除等待
         self._update_complete.set()  # 设置完成事件以解除等待
+        self._ready_event.set()  # 解除等待就绪的协程
+        waiters, self._update_waiters = self._update_waiters, []
+        self._resolve_waiters(waiters)
         if self._task:
             self._task.cancel()
         logger.info(f"ChatObserver for {self.stream_id} stopped")
@@ -310,7 +454,7 @@ class ChatObserver:
 
         for msg in messages:
             try:
-                user_info = UserInfo.from_dict(msg.get("user_info", {}))
+                user_info = msg.get("_user_info") or UserInfo.from_dict(msg.get("user_info", {}))
                 if user_info.user_id == global_config.BOT_QQ:
                     self.update_bot_speak_time(msg["time"])
                 else:
@@ -353,9 +497,9 @@ class ChatObserver:
             limit: 获取的最大消息数量，默认50
 
         Returns:
-            List[Dict[str, Any]]: 缓存的消息历史列表
+            List[Dict[str, Any]]: 缓存的消息历史列表，最新的消息在前
         """
-        return self.message_cache[:limit]
+        return list(islice(reversed(self.message_history), limit))
 
     def get_last_message(self) -> Optional[Dict[str, Any]]:
         """获取最后一条消息
@@ -363,9 +507,7 @@ class ChatObserver:
         Returns:
             Optional[Dict[str, Any]]: 最后一条消息，如果没有则返回None
         """
-        if not self.message_cache:
-            return None
-        return self.message_cache[0]
+        return self.latest_message
 
     def __str__(self):
         return f"ChatObserver for {self.stream_id}"
@@ -203,6 +203,8 @@ def create_new_message_notification(sender: str, target: str, message: Dict[str,
             "detailed_plain_text": message.get("detailed_plain_text"),
             "user_info": message.get("user_info"),
             "time": message.get("time"),
+            "_time_str": message.get("_time_str"),
+            "_user_info": message.get("_user_info"),
         },
     )
 
@@ -1,6 +1,7 @@
 import asyncio
-import datetime
-from typing import Dict, Any
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Awaitable, Optional, Tuple
 from ..chat.message import Message
 from .pfc_types import ConversationState
 from .pfc import ChatObserver, GoalAnalyzer, DirectMessageSender
@@ -14,6 +15,7 @@ from ..message.message_base import UserInfo
 from src.plugins.chat.chat_stream import chat_manager
 from .pfc_KnowledgeFetcher import KnowledgeFetcher
 from .waiter import Waiter
+from .pfc_utils import now_hms
 
 import traceback
 
@@ -32,10 +34,26 @@ class Conversation:
         self.stream_id = stream_id
         self.state = ConversationState.INIT
         self.should_continue = False
+        self.last_activity = time.monotonic()  # 最近一次执行行动的时间，供管理器清理空闲实例
+        self._stop_event = asyncio.Event()  # 对话停止时设置，用于中断进行中的规划与行动
+
+        # 行动 -> 处理方法，未列出的行动按wait处理
+        self._action_handlers = {
+            "direct_reply": self._do_direct_reply,
+            "fetch_knowledge": self._do_fetch_knowledge,
+            "rethink_goal": self._do_rethink_goal,
+            "listening": self._do_listening,
+            "end_conversation": self._do_end_conversation,
+            "wait": self._do_wait,
+        }
 
         # 回复相关
         self.generated_reply = ""
 
+        # 已转换消息的LRU缓存：message_id -> Message，同一条消息只转换一次
+        self._msg_cache: "OrderedDict[str, Message]" = OrderedDict()
+        self._msg_cache_size = 256
+
     async def _initialize(self):
         """初始化实例，注册所有组件"""
 
@@ -63,6 +81,8 @@ class Conversation:
             self.chat_observer.start()
             self.observation_info = ObservationInfo()
             self.observation_info.bind_to_chat_observer(self.chat_observer)
+            # 等观察器完成首次拉取再开始规划，避免基于空的聊天记录做决策
+            await self.chat_observer.wait_ready(timeout=5.0)
             # print(self.chat_observer.get_cached_messages(limit=)
 
             self.conversation_info = ConversationInfo()
@@ -88,13 +108,21 @@ class Conversation:
         """思考步，PFC核心循环模块"""
         # 获取最近的消息历史
         while self.should_continue:
-            # 使用决策信息来辅助行动规划
-            action, reason = await self.action_planner.plan(self.observation_info, self.conversation_info)
+            completed, planned = await self._run_unless_stopped(self._plan())
+            if not completed:
+                break
+            if planned is None:
+                continue
+            action, reason = planned
             if self._check_new_messages_after_planning():
                 continue
 
             # 执行行动
-            await self._handle_action(action, reason, self.observation_info, self.conversation_info)
+            completed, _ = await self._run_unless_stopped(
+                self._handle_action(action, reason, self.observation_info, self.conversation_info)
+            )
+            if not completed:
+                break
 
             for goal in self.conversation_info.goal_list:
                 # 检查goal是否为元组类型，如果是元组则使用索引访问，如果是字典则使用get方法
@@ -102,9 +130,73 @@ class Conversation:
                     # 假设元组的第一个元素是目标内容
                     print(f"goal: {goal}")
                     if goal[0] == "结束对话":
-                        self.should_continue = False
+                        await self._stop_conversation()
                         break
 
+    def _transition(self, new_state: ConversationState):
+        """切换对话状态，与当前状态相同时不做任何事
+
+        Args:
+            new_state: 新状态
+        """
+        if self.state is new_state:
+            return
+        logger.debug(f"对话 {self.stream_id} 状态: {self.state.name} -> {new_state.name}")
+        self.state = new_state
+
+    async def _plan(self) -> Optional[Tuple[str, str]]:
+        """规划下一步行动
+
+        Returns:
+            Optional[Tuple[str, str]]: (行动, 原因)，目标刚刚重新分析过、需要重新规划时返回None
+        """
+        if not self.conversation_info.goal_list:
+            # 还没有对话目标时，规划器多半会选择rethink_goal，
+            # 因此目标分析与行动规划并发执行，省去一次串行的LLM往返
+            (action, reason), _ = await asyncio.gather(
+                self.action_planner.plan(self.observation_info, self.conversation_info),
+                self.goal_analyzer.analyze_goal(self.conversation_info, self.observation_info),
+            )
+            if action == "rethink_goal" and self.conversation_info.goal_list:
+                # 目标刚刚分析过，直接基于新目标重新规划
+                return None
+            return action, reason
+
+        # 使用决策信息来辅助行动规划
+        return await self.action_planner.plan(self.observation_info, self.conversation_info)
+
+    async def _run_unless_stopped(self, coro: Awaitable[Any]) -> Tuple[bool, Any]:
+        """执行一步规划或行动，对话在此期间被停止时取消该步骤
+
+        进行中的LLM请求会随之取消，不会在对话结束后继续占用后端。
+
+        Args:
+            coro: 要执行的协程
+
+        Returns:
+            Tuple[bool, Any]: (是否执行完成, 执行结果)
+        """
+        step = asyncio.ensure_future(coro)
+        stop_waiter = asyncio.ensure_future(self._stop_event.wait())
+        try:
+            done, _ = await asyncio.wait({step, stop_waiter}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            step.cancel()
+            raise
+        finally:
+            stop_waiter.cancel()
+
+        if step in done:
+            return True, step.result()
+
+        logger.info(f"对话 {self.stream_id} 已停止，取消进行中的步骤")
+        step.cancel()
+        try:
+            await step
+        except asyncio.CancelledError:
+            pass
+        return False, None
+
     def _check_new_messages_after_planning(self):
         """检查在规划后是否有新消息"""
         if self.observation_info.new_messages_count > 0:
@@ -114,29 +206,37 @@ class Conversation:
         return False
 
     def _convert_to_message(self, msg_dict: Dict[str, Any]) -> Message:
-        """将消息字典转换为Message对象"""
-        try:
-            chat_info = msg_dict.get("chat_info", {})
-            chat_stream = ChatStream.from_dict(chat_info)
-            user_info = UserInfo.from_dict(msg_dict.get("user_info", {}))
-
-            return Message(
-                message_id=msg_dict["message_id"],
-                chat_stream=chat_stream,
-                time=msg_dict["time"],
-                user_info=user_info,
-                processed_plain_text=msg_dict.get("processed_plain_text", ""),
-                detailed_plain_text=msg_dict.get("detailed_plain_text", ""),
-            )
-        except Exception as e:
-            logger.warning(f"转换消息时出错: {e}")
-            raise
+        """将消息字典转换为Message对象，按message_id缓存转换结果
+
+        转换失败时异常直接抛出，由调用处统一处理
+        """
+        message_id = msg_dict["message_id"]
+        cached = self._msg_cache.get(message_id)
+        if cached is not None:
+            self._msg_cache.move_to_end(message_id)
+            return cached
+
+        message = Message(
+            message_id=message_id,
+            chat_stream=ChatStream.from_dict(msg_dict.get("chat_info") or {}),
+            time=msg_dict["time"],
+            # 观察器已为到达的消息解析过用户信息，直接复用
+            user_info=msg_dict.get("_user_info") or UserInfo.from_dict(msg_dict.get("user_info") or {}),
+            processed_plain_text=msg_dict.get("processed_plain_text", ""),
+            detailed_plain_text=msg_dict.get("detailed_plain_text", ""),
+        )
+
+        self._msg_cache[message_id] = message
+        if len(self._msg_cache) > self._msg_cache_size:
+            self._msg_cache.popitem(last=False)
+        return message
 
     async def _handle_action(
         self, action: str, reason: str, observation_info: ObservationInfo, conversation_info: ConversationInfo
     ):
         """处理规划的行动"""
-        logger.info(f"执行行动: {action}, 原因: {reason}")
+        self.last_activity = time.monotonic()
+        logger.info("执行行动: {}, 原因: {}", action, reason)
 
         # 记录action历史，先设置为stop，完成后再设置为done
         conversation_info.done_action.append(
@@ -144,87 +244,116 @@ class Conversation:
                 "action": action,
                 "reason": reason,
                 "status": "start",
-                "time": datetime.datetime.now().strftime("%H:%M:%S"),
+                "time": now_hms(),
             }
         )
 
-        if action == "direct_reply":
-            self.waiter.wait_accumulated_time = 0
+        handler = self._action_handlers.get(action, self._do_wait)
+        await handler(reason, observation_info, conversation_info)
 
-            self.state = ConversationState.GENERATING
-            self.generated_reply = await self.reply_generator.generate(observation_info, conversation_info)
-            print(f"生成回复: {self.generated_reply}")
-
-            # # 检查回复是否合适
-            # is_suitable, reason, need_replan = await self.reply_generator.check_reply(
-            #     self.generated_reply,
-            #     self.current_goal
-            # )
+    async def _do_direct_reply(
+        self, reason: str, observation_info: ObservationInfo, conversation_info: ConversationInfo
+    ):
+        """直接回复"""
+        self.waiter.wait_accumulated_time = 0
 
-            if self._check_new_messages_after_planning():
-                logger.info("333333发现新消息，重新考虑行动")
-                conversation_info.done_action[-1].update(
-                    {
-                        "status": "recall",
-                        "time": datetime.datetime.now().strftime("%H:%M:%S"),
-                    }
-                )
-                return None
+        self._transition(ConversationState.GENERATING)
+        # 流式生成，期间对方发来新消息则立即停止生成，不必等完整回复
+        self.generated_reply = await self.reply_generator.generate(
+            observation_info, conversation_info, should_abort=lambda: observation_info.new_messages_count > 0
+        )
+        print(f"生成回复: {self.generated_reply}")
 
-            await self._send_reply()
+        # # 检查回复是否合适
+        # is_suitable, reason, need_replan = await self.reply_generator.check_reply(
+        #     self.generated_reply,
+        #     self.current_goal
+        # )
 
+        if self._check_new_messages_after_planning():
+            logger.info("333333发现新消息，重新考虑行动")
             conversation_info.done_action[-1].update(
                 {
-                    "status": "done",
-                    "time": datetime.datetime.now().strftime("%H:%M:%S"),
+                    "status": "recall",
+                    "time": now_hms(),
                 }
             )
+            return None
 
-        elif action == "fetch_knowledge":
-            self.waiter.wait_accumulated_time = 0
+        await self._send_reply()
 
-            self.state = ConversationState.FETCHING
-            knowledge = "TODO:知识"
-            topic = "TODO:关键词"
+        conversation_info.done_action[-1].update(
+            {
+                "status": "done",
+                "time": now_hms(),
+            }
+        )
 
-            logger.info(f"假装获取到知识{knowledge}，关键词是: {topic}")
+    async def _do_fetch_knowledge(
+        self, reason: str, observation_info: ObservationInfo, conversation_info: ConversationInfo
+    ):
+        """获取知识"""
+        self.waiter.wait_accumulated_time = 0
 
-            if knowledge:
-                if topic not in self.conversation_info.knowledge_list:
-                    self.conversation_info.knowledge_list.append({"topic": topic, "knowledge": knowledge})
-                else:
-                    self.conversation_info.knowledge_list[topic] += knowledge
+        self._transition(ConversationState.FETCHING)
+        knowledge = "TODO:知识"
+        topic = "TODO:关键词"
+        source = "TODO:来源"
 
-        elif action == "rethink_goal":
-            self.waiter.wait_accumulated_time = 0
+        logger.info("假装获取到知识{}，关键词是: {}", knowledge, topic)
 
-            self.state = ConversationState.RETHINKING
-            await self.goal_analyzer.analyze_goal(conversation_info, observation_info)
+        if knowledge:
+            conversation_info.add_knowledge(topic, knowledge, source)
 
-        elif action == "listening":
-            self.state = ConversationState.LISTENING
-            logger.info("倾听对方发言...")
-            await self.waiter.wait_listening(conversation_info)
+    async def _do_rethink_goal(
+        self, reason: str, observation_info: ObservationInfo, conversation_info: ConversationInfo
+    ):
+        """重新思考对话目标"""
+        self.waiter.wait_accumulated_time = 0
 
-        elif action == "end_conversation":
-            self.should_continue = False
-            logger.info("决定结束对话...")
+        self._transition(ConversationState.RETHINKING)
+        await self.goal_analyzer.analyze_goal(conversation_info, observation_info)
 
-        else:  # wait
-            self.state = ConversationState.WAITING
-            logger.info("等待更多信息...")
-            await self.waiter.wait(self.conversation_info)
+    async def _do_listening(self, reason: str, observation_info: ObservationInfo, conversation_info: ConversationInfo):
+        """倾听对方发言"""
+        self._transition(ConversationState.LISTENING)
+        logger.info("倾听对方发言...")
+        await self.waiter.wait_listening(conversation_info)
+
+    async def _do_end_conversation(
+        self, reason: str, observation_info: ObservationInfo, conversation_info: ConversationInfo
+    ):
+        """结束对话"""
+        logger.info("决定结束对话...")
+        # 与被管理器停止时一样，设置停止事件并解绑观察器
+        await self._stop_conversation()
+
+    async def _do_wait(self, reason: str, observation_info: ObservationInfo, conversation_info: ConversationInfo):
+        """等待更多信息，也是未知行动的默认处理"""
+        self._transition(ConversationState.WAITING)
+        logger.info("等待更多信息...")
+        await self.waiter.wait(conversation_info)
+
+    async def _stop_conversation(self):
+        """停止对话，解除观测信息的绑定并停止观察器"""
+        self.should_continue = False
+        self._transition(ConversationState.ENDED)
+        self._stop_event.set()
+        self.observation_info.unbind_from_chat_observer()
+        self.chat_observer.stop()
+        logger.info(f"对话 {self.stream_id} 已停止")
 
     async def _send_timeout_message(self):
         """发送超时结束消息"""
         try:
-            messages = self.chat_observer.get_cached_messages(limit=1)
-            if not messages:
+            latest_message = self.chat_observer.get_last_message()
+            if latest_message is None:
                 return
 
-            latest_message = self._convert_to_message(messages[0])
             await self.direct_sender.send_message(
-                chat_stream=self.chat_stream, content="TODO:超时消息", reply_to_message=latest_message
+                chat_stream=self.chat_stream,
+                content="TODO:超时消息",
+                reply_to_message=self._convert_to_message(latest_message),
             )
         except Exception as e:
             logger.error(f"发送超时消息失败: {str(e)}")
@@ -237,11 +366,12 @@ class Conversation:
 
         try:
             await self.direct_sender.send_message(chat_stream=self.chat_stream, content=self.generated_reply)
-            self.chat_observer.trigger_update()  # 触发立即更新
-            if not await self.chat_observer.wait_for_update():
+            # 立即刷新一次，让刚发出的消息进入聊天记录
+            if not await self.chat_observer.update_now():
                 logger.warning("等待消息更新超时")
-
-            self.state = ConversationState.ANALYZING
         except Exception as e:
             logger.error(f"发送消息失败: {str(e)}")
-            self.state = ConversationState.ANALYZING
+        finally:
+            # 对话被停止时步骤会被取消，此时保持ENDED状态
+            if self.state is not ConversationState.ENDED:
+                self._transition(ConversationState.ANALYZING)
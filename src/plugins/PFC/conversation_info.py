@@ -1,6 +1,27 @@
+from collections import OrderedDict, deque
+from typing import Dict, Tuple
+
+
 class ConversationInfo:
     def __init__(self):
-        self.done_action = []
+        self.done_action = deque(maxlen=10)  # 只保留最近的行动记录，提示词也只展示这么多
         self.goal_list = []
-        self.knowledge_list = []
+        # 知识来源 -> {"topic", "knowledge", "source"}，按最近使用排序，超出上限时淘汰最久未用的
+        self.knowledge_cache: "OrderedDict[Tuple[str, ...], Dict[str, str]]" = OrderedDict()
+        self.knowledge_cache_size = 64
         self.memory_list = []
+
+    def add_knowledge(self, topic: str, knowledge: str, source: str):
+        """记录获取到的知识，来源相同的知识只保留一份
+
+        Args:
+            topic: 查询关键词
+            knowledge: 知识内容
+            source: 知识来源，多个来源以"，"分隔
+        """
+        # 来源顺序不同的同一组记忆片段视为同一条知识
+        key = tuple(sorted(set(source.split("，"))))
+        self.knowledge_cache[key] = {"topic": topic, "knowledge": knowledge, "source": source}
+        self.knowledge_cache.move_to_end(key)
+        while len(self.knowledge_cache) > self.knowledge_cache_size:
+            self.knowledge_cache.popitem(last=False)
@@ -0,0 +1,71 @@
+import asyncio
+import os
+from typing import AsyncIterator, Optional, Tuple
+from src.common.logger import get_module_logger
+from ..models.utils_model import LLM_request
+
+logger = get_module_logger("llm_batcher")
+
+
+class LLMBatcher:
+    """PFC全局的LLM请求入口
+
+    后端没有批量接口，请求按到达顺序各自直接下发，不做合批。
+    同时在途的请求数受信号量限制（环境变量PFC_MAX_INFLIGHT_LLM，默认32），
+    超出的请求在此排队，避免大量对话同时把后端打满。
+    """
+
+    _instance: Optional["LLMBatcher"] = None
+
+    @classmethod
+    def get_instance(cls) -> "LLMBatcher":
+        """获取请求入口单例
+
+        Returns:
+            LLMBatcher: 请求入口实例
+        """
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, max_inflight: Optional[int] = None):
+        """初始化请求入口
+
+        Args:
+            max_inflight: 同时在途的最大请求数，为None时读取环境变量PFC_MAX_INFLIGHT_LLM
+        """
+        if max_inflight is None:
+            max_inflight = int(os.getenv("PFC_MAX_INFLIGHT_LLM", "32"))
+        self._semaphore = asyncio.Semaphore(max_inflight)
+
+    async def submit(self, llm: LLM_request, prompt: str) -> Tuple:
+        """在并发上限内发起一次请求并等待结果
+
+        调用方取消等待（如对话已停止）时，底层请求随之取消
+
+        Args:
+            llm: 发起请求的LLM实例
+            prompt: 提示词
+
+        Returns:
+            Tuple: 与LLM_request.generate_response_async相同的返回值
+        """
+        async with self._semaphore:
+            return await llm.generate_response_async(prompt)
+
+    async def stream(self, llm: LLM_request, prompt: str) -> AsyncIterator[str]:
+        """流式请求，逐段产出模型输出
+
+        同样占用一个在途请求名额，直到迭代结束。
+
+        Args:
+            llm: 发起请求的LLM实例
+            prompt: 提示词
+        """
+        async with self._semaphore:
+            stream = llm.stream_response_async(prompt)
+            try:
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.aclose()
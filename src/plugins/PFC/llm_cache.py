@@ -0,0 +1,70 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Tuple
+from src.common.logger import get_module_logger
+
+logger = get_module_logger("llm_cache")
+
+
+class TTLPromptCache:
+    """按提示词哈希缓存LLM响应
+
+    对话状态没有变化时，规划和目标分析会得到逐字相同的提示词，
+    短时间内直接复用上一次的响应，省去一次LLM往返。
+    条目超过存活时间即失效，总数超过上限时淘汰最久未使用的条目。
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 5.0):
+        """初始化缓存
+
+        Args:
+            maxsize: 最多缓存的条目数
+            ttl: 条目存活时间（秒）
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[bytes, Tuple[float, Any]]" = OrderedDict()
+
+    @staticmethod
+    def make_key(prompt: str) -> bytes:
+        """计算提示词的缓存键
+
+        Args:
+            prompt: 提示词
+
+        Returns:
+            bytes: 16字节的blake2b摘要
+        """
+        return hashlib.blake2b(prompt.encode("utf-8"), digest_size=16).digest()
+
+    async def get_or_compute(self, key: bytes, coro_factory: Callable[[], Awaitable[Any]]) -> Any:
+        """命中且未过期时返回缓存值，否则调用coro_factory计算并缓存
+
+        Args:
+            key: 缓存键
+            coro_factory: 返回待等待对象的函数，仅在未命中时调用
+
+        Returns:
+            Any: 缓存的或新计算的响应，计算出错时异常原样抛出且不会被缓存
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            created_at, value = entry
+            if time.monotonic() - created_at < self.ttl:
+                self._entries.move_to_end(key)
+                logger.debug("提示词缓存命中，跳过LLM请求")
+                return value
+            del self._entries[key]
+
+        value = await coro_factory()
+
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return value
+
+
+# 规划与目标分析共用的提示词缓存
+prompt_cache = TTLPromptCache()
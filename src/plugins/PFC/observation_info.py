@@ -1,10 +1,12 @@
 # Programmable Friendly Conversationalist
 # Prefrontal cortex
-from typing import List, Optional, Dict, Any, Set
+from collections import deque
+from typing import List, Optional, Dict, Any, Deque
 from ..message.message_base import UserInfo
 import time
 from dataclasses import dataclass, field
 from src.common.logger import get_module_logger
+from ..config.config import global_config
 from .chat_observer import ChatObserver
 from .chat_states import NotificationHandler, NotificationType
 
@@ -29,7 +31,7 @@ class ObservationInfoHandler(NotificationHandler):
 
         if notification_type == NotificationType.NEW_MESSAGE:
             # 处理新消息通知
-            logger.debug(f"收到新消息通知data: {data}")
+            logger.debug("收到新消息通知data: {}", data)
             message_id = data.get("message_id")
             processed_plain_text = data.get("processed_plain_text")
             detailed_plain_text = data.get("detailed_plain_text")
@@ -42,6 +44,7 @@ class ObservationInfoHandler(NotificationHandler):
                 "detailed_plain_text": detailed_plain_text,
                 "user_info": user_info,
                 "time": time_value,
+                "_user_info": data.get("_user_info"),
             }
 
             self.observation_info.update_from_message(message)
@@ -54,7 +57,7 @@ class ObservationInfoHandler(NotificationHandler):
         elif notification_type == NotificationType.ACTIVE_CHAT:
             # 处理活跃通知
             is_active = data.get("is_active", False)
-            self.observation_info.is_cold = not is_active
+            self.observation_info.is_cold_chat = not is_active
 
         elif notification_type == NotificationType.BOT_SPEAKING:
             # 处理机器人说话通知
@@ -69,21 +72,24 @@ class ObservationInfoHandler(NotificationHandler):
         elif notification_type == NotificationType.MESSAGE_DELETED:
             # 处理消息删除通知
             message_id = data.get("message_id")
-            self.observation_info.unprocessed_messages = [
-                msg for msg in self.observation_info.unprocessed_messages if msg.get("message_id") != message_id
-            ]
+            unprocessed_messages = self.observation_info.unprocessed_messages
+            self.observation_info.unprocessed_messages = deque(
+                (msg for msg in unprocessed_messages if msg.get("message_id") != message_id),
+                maxlen=unprocessed_messages.maxlen,
+            )
+            self.observation_info.new_messages_count = len(self.observation_info.unprocessed_messages)
 
         elif notification_type == NotificationType.USER_JOINED:
             # 处理用户加入通知
             user_id = data.get("user_id")
             if user_id:
-                self.observation_info.active_users.add(user_id)
+                self.observation_info.active_users[user_id] = time.time()
 
         elif notification_type == NotificationType.USER_LEFT:
             # 处理用户离开通知
             user_id = data.get("user_id")
             if user_id:
-                self.observation_info.active_users.discard(user_id)
+                self.observation_info.active_users.pop(user_id, None)
 
         elif notification_type == NotificationType.ERROR:
             # 处理错误通知
@@ -91,14 +97,16 @@ class ObservationInfoHandler(NotificationHandler):
             logger.error(f"收到错误通知: {error_msg}")
 
 
-@dataclass
+@dataclass(slots=True)
 class ObservationInfo:
     """决策信息类，用于收集和管理来自chat_observer的通知信息"""
 
     # data_list
     chat_history: List[str] = field(default_factory=list)
-    unprocessed_messages: List[Dict[str, Any]] = field(default_factory=list)
-    active_users: Set[str] = field(default_factory=set)
+    # 未处理消息使用定长环形缓冲，长时间不处理时丢弃最旧的消息
+    unprocessed_messages: Deque[Dict[str, Any]] = field(default_factory=lambda: deque(maxlen=256))
+    # 活跃用户ID -> 最后发言时间，超过active_user_ttl未发言的用户会被移除
+    active_users: Dict[str, float] = field(default_factory=dict)
 
     # data
     last_bot_speak_time: Optional[float] = None
@@ -110,6 +118,7 @@ class ObservationInfo:
     chat_history_count: int = 0
     new_messages_count: int = 0
     cold_chat_duration: float = 0.0
+    active_user_ttl: float = 1800.0
 
     # state
     is_typing: bool = False
@@ -117,12 +126,16 @@ class ObservationInfo:
     is_cold_chat: bool = False
     changed: bool = False
 
+    # 运行时绑定，不参与构造
+    last_message_id: Optional[str] = field(default=None, init=False)
+    chat_observer: Optional[ChatObserver] = field(default=None, init=False)
+    handler: Optional[ObservationInfoHandler] = field(default=None, init=False)
+
     # #spec
     # meta_plan_trigger: bool = False
 
     def __post_init__(self):
         """初始化后创建handler"""
-        self.chat_observer = None
         self.handler = ObservationInfoHandler(self)
 
     def bind_to_chat_observer(self, chat_observer: ChatObserver):
@@ -132,6 +145,8 @@ class ObservationInfo:
             stream_id: 聊天流ID
         """
         self.chat_observer = chat_observer
+        # 观察器也会读到自己发出的消息，需要据此区分
+        self.bot_id = str(global_config.BOT_QQ)
         self.chat_observer.notification_manager.register_handler(
             target="observation_info", notification_type=NotificationType.NEW_MESSAGE, handler=self.handler
         )
@@ -164,20 +179,37 @@ class ObservationInfo:
 
         self.last_message_content = message.get("processed_plain_text", "")
 
-        user_info = UserInfo.from_dict(message.get("user_info", {}))
+        # 观察器在消息到达时已预先解析过，其他途径来的消息在这里补上
+        user_info = message.get("_user_info")
+        if user_info is None:
+            user_info = message["_user_info"] = UserInfo.from_dict(message.get("user_info", {}))
         self.last_message_sender = user_info.user_id
 
-        if user_info.user_id == self.bot_id:
+        if str(user_info.user_id) == self.bot_id:
+            # 自己的发言直接进入聊天记录，不算作待处理的新消息
             self.last_bot_speak_time = message["time"]
+            self.chat_history.append(message)
+            self.chat_history_count = len(self.chat_history)
         else:
             self.last_user_speak_time = message["time"]
-            self.active_users.add(user_info.user_id)
+            self.active_users[user_info.user_id] = message["time"]
+            self._evict_inactive_users(message["time"])
 
-        self.new_messages_count += 1
-        self.unprocessed_messages.append(message)
+            self.unprocessed_messages.append(message)
+            self.new_messages_count = len(self.unprocessed_messages)
 
         self.update_changed()
 
+    def _evict_inactive_users(self, current_time: float):
+        """移除超过active_user_ttl没有发言的活跃用户
+
+        Args:
+            current_time: 当前时间
+        """
+        expire_before = current_time - self.active_user_ttl
+        for user_id in [uid for uid, last_seen in self.active_users.items() if last_seen < expire_before]:
+            del self.active_users[user_id]
+
     def update_changed(self):
         """更新changed状态"""
         self.changed = True
@@ -1,9 +1,8 @@
 # Programmable Friendly Conversationalist
 # Prefrontal cortex
-import datetime
-
-# import asyncio
-from typing import List, Optional, Tuple, TYPE_CHECKING
+import itertools
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+import aiohttp
 from src.common.logger import get_module_logger
 from ..chat.chat_stream import ChatStream
 from ..message.message_base import UserInfo, Seg
@@ -14,8 +13,16 @@ from src.plugins.chat.message import MessageSending
 from ..message.api import global_api
 from ..storage.storage import MessageStorage
 from .chat_observer import ChatObserver
-from .pfc_utils import get_items_from_json
-from src.individuality.individuality import Individuality
+from .pfc_utils import (
+    get_items_from_json,
+    build_goals_text,
+    build_action_history_text,
+    build_chat_history_text,
+    get_personality_prompt,
+    get_personality_text,
+)
+from .llm_batcher import LLMBatcher
+from .llm_cache import prompt_cache
 from .conversation_info import ConversationInfo
 from .observation_info import ObservationInfo
 import time
@@ -25,6 +32,57 @@ if TYPE_CHECKING:
 
 logger = get_module_logger("pfc")
 
+_GOAL_PROMPT = """{personality}。现在你在参与一场QQ聊天，请分析以下聊天记录，并根据你的性格特征确定多个明确的对话目标。
+这些目标应该反映出对话的不同方面和意图。
+
+{action_history}当前对话目标：
+{goals}
+
+聊天记录：
+{chat_history}
+
+请分析当前对话并确定最适合的对话目标。你可以：
+1. 保持现有目标不变
+2. 修改现有目标
+3. 添加新目标
+4. 删除不再相关的目标
+5. 如果你想结束对话，请设置一个目标，目标goal为"结束对话"，原因reasoning为你希望结束对话
+
+请以JSON数组格式输出当前的所有对话目标，每个目标包含以下字段：
+1. goal: 对话目标（简短的一句话）
+2. reasoning: 对话原因，为什么设定这个目标（简要解释）
+
+输出格式示例：
+[
+  {{
+    "goal": "回答用户关于Python编程的具体问题",
+    "reasoning": "用户提出了关于Python的技术问题，需要专业且准确的解答"
+  }},
+  {{
+    "goal": "回答用户关于python安装的具体问题",
+    "reasoning": "用户提出了关于Python的技术问题，需要专业且准确的解答"
+  }}
+]"""
+
+_CONVERSATION_PROMPT = """{personality}。现在你在参与一场QQ聊天，
+        当前对话目标：{goal}
+        产生该对话目标的原因：{reasoning}
+        
+        请分析以下聊天记录，并根据你的性格特征评估该目标是否已经达到，或者你是否希望停止该次对话。
+        聊天记录：
+        {chat_history}
+        请以JSON格式输出，包含以下字段：
+        1. goal_achieved: 对话目标是否已经达到（true/false）
+        2. stop_conversation: 是否希望停止该次对话（true/false）
+        3. reason: 为什么希望停止该次对话（简要解释）   
+
+输出格式示例：
+{{
+    "goal_achieved": true,
+    "stop_conversation": false,
+    "reason": "虽然目标已达成，但对话仍然有继续的价值"
+}}"""
+
 
 class GoalAnalyzer:
     """对话目标分析器"""
@@ -34,9 +92,10 @@ class GoalAnalyzer:
             model=global_config.llm_normal, temperature=0.7, max_tokens=1000, request_type="conversation_goal"
         )
 
-        self.personality_info = Individuality.get_instance().get_prompt(type="personality", x_person=2, level=2)
+        self.personality_info = get_personality_prompt()
         self.name = global_config.BOT_NICKNAME
         self.nick_name = global_config.BOT_ALIAS_NAMES
+        self.personality_text = get_personality_text()
         self.chat_observer = ChatObserver.get_instance(stream_id)
 
         # 多目标存储结构
@@ -54,90 +113,19 @@ class GoalAnalyzer:
         Returns:
             Tuple[str, str, str]: (目标, 方法, 原因)
         """
-        # 构建对话目标
-        goals_str = ""
-        if conversation_info.goal_list:
-            for goal_reason in conversation_info.goal_list:
-                # 处理字典或元组格式
-                if isinstance(goal_reason, tuple):
-                    # 假设元组的第一个元素是目标，第二个元素是原因
-                    goal = goal_reason[0]
-                    reasoning = goal_reason[1] if len(goal_reason) > 1 else "没有明确原因"
-                elif isinstance(goal_reason, dict):
-                    goal = goal_reason.get("goal")
-                    reasoning = goal_reason.get("reasoning", "没有明确原因")
-                else:
-                    # 如果是其他类型，尝试转为字符串
-                    goal = str(goal_reason)
-                    reasoning = "没有明确原因"
-
-                goal_str = f"目标：{goal}，产生该对话目标的原因：{reasoning}\n"
-                goals_str += goal_str
-        else:
-            goal = "目前没有明确对话目标"
-            reasoning = "目前没有明确对话目标，最好思考一个对话目标"
-            goals_str = f"目标：{goal}，产生该对话目标的原因：{reasoning}\n"
-
-        # 获取聊天历史记录
-        chat_history_list = observation_info.chat_history
-        chat_history_text = ""
-        for msg in chat_history_list:
-            chat_history_text += f"{msg}\n"
-
-        if observation_info.new_messages_count > 0:
-            new_messages_list = observation_info.unprocessed_messages
-
-            chat_history_text += f"有{observation_info.new_messages_count}条新消息：\n"
-            for msg in new_messages_list:
-                chat_history_text += f"{msg}\n"
-
-            observation_info.clear_unprocessed_messages()
-
-        personality_text = f"你的名字是{self.name}，{self.personality_info}"
-
-        # 构建action历史文本
-        action_history_list = conversation_info.done_action
-        action_history_text = "你之前做的事情是："
-        for action in action_history_list:
-            action_history_text += f"{action}\n"
-
-        prompt = f"""{personality_text}。现在你在参与一场QQ聊天，请分析以下聊天记录，并根据你的性格特征确定多个明确的对话目标。
-这些目标应该反映出对话的不同方面和意图。
-
-{action_history_text}
-当前对话目标：
-{goals_str}
-
-聊天记录：
-{chat_history_text}
-
-请分析当前对话并确定最适合的对话目标。你可以：
-1. 保持现有目标不变
-2. 修改现有目标
-3. 添加新目标
-4. 删除不再相关的目标
-5. 如果你想结束对话，请设置一个目标，目标goal为"结束对话"，原因reasoning为你希望结束对话
-
-请以JSON数组格式输出当前的所有对话目标，每个目标包含以下字段：
-1. goal: 对话目标（简短的一句话）
-2. reasoning: 对话原因，为什么设定这个目标（简要解释）
-
-输出格式示例：
-[
-  {{
-    "goal": "回答用户关于Python编程的具体问题",
-    "reasoning": "用户提出了关于Python的技术问题，需要专业且准确的解答"
-  }},
-  {{
-    "goal": "回答用户关于python安装的具体问题",
-    "reasoning": "用户提出了关于Python的技术问题，需要专业且准确的解答"
-  }}
-]"""
+        prompt = _GOAL_PROMPT.format(
+            personality=self.personality_text,
+            goals=build_goals_text(conversation_info.goal_list),
+            action_history=build_action_history_text(conversation_info.done_action),
+            chat_history=build_chat_history_text(observation_info),
+        )
 
-        logger.debug(f"发送到LLM的提示词: {prompt}")
+        logger.debug("发送到LLM的提示词: {}", prompt)
         try:
-            content, _ = await self.llm.generate_response_async(prompt)
-            logger.debug(f"LLM原始返回内容: {content}")
+            content, _ = await prompt_cache.get_or_compute(
+                prompt_cache.make_key(prompt), lambda: LLMBatcher.get_instance().submit(self.llm, prompt)
+            )
+            logger.debug("LLM原始返回内容: {}", content)
         except Exception as e:
             logger.error(f"分析对话目标时出错: {str(e)}")
             content = ""
@@ -150,12 +138,8 @@ class GoalAnalyzer:
         if success:
             # 判断结果是单个字典还是字典列表
             if isinstance(result, list):
-                # 清空现有目标列表并添加新目标
-                conversation_info.goal_list = []
-                for item in result:
-                    goal = item.get("goal", "")
-                    reasoning = item.get("reasoning", "")
-                    conversation_info.goal_list.append((goal, reasoning))
+                # 新目标列表构建完成后一次性替换，与之并发的行动规划只会读到完整的旧列表或新列表
+                conversation_info.goal_list = [(item.get("goal", ""), item.get("reasoning", "")) for item in result]
 
                 # 返回第一个目标作为当前主要目标（如果有）
                 if result:
@@ -233,40 +217,16 @@ class GoalAnalyzer:
         return self.goals[1:].copy()
 
     async def analyze_conversation(self, goal, reasoning):
-        messages = self.chat_observer.get_cached_messages()
-        chat_history_text = ""
-        for msg in messages:
-            time_str = datetime.datetime.fromtimestamp(msg["time"]).strftime("%H:%M:%S")
-            user_info = UserInfo.from_dict(msg.get("user_info", {}))
-            sender = user_info.user_nickname or f"用户{user_info.user_id}"
-            if sender == self.name:
-                sender = "你说"
-            chat_history_text += f"{time_str},{sender}:{msg.get('processed_plain_text', '')}\n"
-
-        personality_text = f"你的名字是{self.name}，{self.personality_info}"
-
-        prompt = f"""{personality_text}。现在你在参与一场QQ聊天，
-        当前对话目标：{goal}
-        产生该对话目标的原因：{reasoning}
-        
-        请分析以下聊天记录，并根据你的性格特征评估该目标是否已经达到，或者你是否希望停止该次对话。
-        聊天记录：
-        {chat_history_text}
-        请以JSON格式输出，包含以下字段：
-        1. goal_achieved: 对话目标是否已经达到（true/false）
-        2. stop_conversation: 是否希望停止该次对话（true/false）
-        3. reason: 为什么希望停止该次对话（简要解释）   
-
-输出格式示例：
-{{
-    "goal_achieved": true,
-    "stop_conversation": false,
-    "reason": "虽然目标已达成，但对话仍然有继续的价值"
-}}"""
+        prompt = _CONVERSATION_PROMPT.format(
+            personality=self.personality_text,
+            goal=goal,
+            reasoning=reasoning,
+            chat_history=self.chat_observer.get_rendered_history(),
+        )
 
         try:
-            content, _ = await self.llm.generate_response_async(prompt)
-            logger.debug(f"LLM原始返回内容: {content}")
+            content, _ = await LLMBatcher.get_instance().submit(self.llm, prompt)
+            logger.debug("LLM原始返回内容: {}", content)
 
             # 尝试解析JSON
             success, result = get_items_from_json(
@@ -293,15 +253,86 @@ class GoalAnalyzer:
 
 
 class DirectMessageSender:
-    """直接发送消息到平台的发送器"""
+    """直接发送消息到平台的发送器
+
+    所有发送器共用一个HTTP会话，REST发送复用已建立的长连接，不必每条消息都重新握手
+    """
+
+    _session: Optional[aiohttp.ClientSession] = None
+    _id_counter = itertools.count()  # 与纳秒时间戳一起组成消息ID，并发发送时也不会重复
+    # 平台 -> (机器人用户信息, REST端点)，两者都只由配置决定，所有发送器共用，每个平台只构建一次
+    _platform_info: Dict[str, Tuple[UserInfo, Optional[str]]] = {}
 
     def __init__(self):
         self.logger = get_module_logger("direct_sender")
         self.storage = MessageStorage()
 
-    async def send_via_ws(self, message: MessageSending) -> None:
+    @classmethod
+    def _get_session(cls) -> aiohttp.ClientSession:
+        """获取共用的HTTP会话，不存在或已关闭时新建"""
+        if cls._session is None or cls._session.closed:
+            cls._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=64, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=10),
+                headers={"Content-Type": "application/json"},
+            )
+        return cls._session
+
+    @classmethod
+    async def aclose(cls):
+        """关闭共用的HTTP会话，在程序退出时调用"""
+        if cls._session is not None and not cls._session.closed:
+            await cls._session.close()
+        cls._session = None
+
+    @classmethod
+    def _get_platform_info(cls, platform: str) -> Tuple[UserInfo, Optional[str]]:
+        """获取指定平台的机器人用户信息和REST端点
+
+        Args:
+            platform: 平台名称
+
+        Returns:
+            Tuple[UserInfo, Optional[str]]: (机器人用户信息, REST端点)，未配置端点时为None
+        """
+        platform_info = cls._platform_info.get(platform)
+        if platform_info is None:
+            bot_user_info = UserInfo(
+                user_id=global_config.BOT_QQ,
+                user_nickname=global_config.BOT_NICKNAME,
+                platform=platform,
+            )
+            end_point = global_config.api_urls.get(platform, None)
+            if end_point is None:
+                logger.info(f"平台 {platform} 未配置REST端点，将使用ws发送")
+            platform_info = cls._platform_info[platform] = (bot_user_info, end_point)
+        return platform_info
+
+    async def send_via_rest(self, url: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """通过共用的HTTP会话发送消息到指定端点
+
+        Args:
+            url: 平台的REST端点
+            data: 消息数据
+
+        Returns:
+            Dict[str, Any]: 端点返回的数据
+        """
+        async with self._get_session().post(url, json=data) as response:
+            return await response.json()
+
+    async def send_via_ws(self, message: MessageSending, message_json: Optional[Dict[str, Any]] = None) -> None:
+        """通过ws发送消息
+
+        Args:
+            message: 要发送的消息
+            message_json: 已序列化的消息数据，传入时直接复用，不再重新序列化
+        """
         try:
-            await global_api.send_message(message)
+            if message_json is None:
+                await global_api.send_message(message)
+            else:
+                await global_api.broadcast_to_platform(message.message_info.platform, message_json)
         except Exception as e:
             raise ValueError(f"未找到平台：{message.message_info.platform} 的url配置，请检查配置文件") from e
 
@@ -320,14 +351,10 @@ class DirectMessageSender:
         """
         # 构建消息对象
         message_segment = Seg(type="text", data=content)
-        bot_user_info = UserInfo(
-            user_id=global_config.BOT_QQ,
-            user_nickname=global_config.BOT_NICKNAME,
-            platform=chat_stream.platform,
-        )
+        bot_user_info, end_point = self._get_platform_info(chat_stream.platform)
 
         message = MessageSending(
-            message_id=f"dm{round(time.time(), 2)}",
+            message_id=f"dm{time.time_ns()}_{next(self._id_counter)}",
             chat_stream=chat_stream,
             bot_user_info=bot_user_info,
             sender_info=reply_to_message.message_info.user_info if reply_to_message else None,
@@ -341,22 +368,35 @@ class DirectMessageSender:
         # 处理消息
         await message.process()
 
+        # 只序列化一次，REST与ws两种发送方式共用
         message_json = message.to_dict()
 
-        # 发送消息
         try:
-            end_point = global_config.api_urls.get(message.message_info.platform, None)
-            if end_point:
-                # logger.info(f"发送消息到{end_point}")
-                # logger.info(message_json)
-                try:
-                    await global_api.send_message_REST(end_point, message_json)
-                except Exception as e:
-                    logger.error(f"REST方式发送失败，出现错误: {str(e)}")
-                    logger.info("尝试使用ws发送")
-                    await self.send_via_ws(message)
-            else:
-                await self.send_via_ws(message)
-            logger.success(f"PFC消息已发送: {content}")
+            await self._deliver(message, message_json, end_point)
+            logger.success("PFC消息已发送: {}", content)
         except Exception as e:
             logger.error(f"PFC消息发送失败: {str(e)}")
+            return
+
+        # 发送成功后入库，观察器才能读到自己的发言
+        await self.storage.store_message(message, chat_stream)
+
+    async def _deliver(self, message: MessageSending, message_json: Dict[str, Any], end_point: Optional[str]) -> None:
+        """把消息发往平台，优先使用REST，失败或未配置时改用ws
+
+        Args:
+            message: 要发送的消息
+            message_json: 消息序列化后的数据
+            end_point: 平台的REST端点，为None时直接使用ws
+        """
+        if end_point:
+            # logger.info(f"发送消息到{end_point}")
+            # logger.info(message_json)
+            try:
+                await self.send_via_rest(end_point, message_json)
+            except Exception as e:
+                logger.error(f"REST方式发送失败，出现错误: {str(e)}")
+                logger.info("尝试使用ws发送")
+                await self.send_via_ws(message, message_json)
+        else:
+            await self.send_via_ws(message, message_json)
@@ -1,4 +1,4 @@
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from src.common.logger import get_module_logger
 from src.plugins.memory_system.Hippocampus import HippocampusManager
 from ..models.utils_model import LLM_request
@@ -19,7 +19,7 @@ class KnowledgeFetcher:
             request_type="knowledge_fetch",
         )
 
-    async def fetch(self, query: str, chat_history: List[Message]) -> Tuple[str, str]:
+    async def fetch(self, query: str, chat_history: List[Message]) -> Tuple[Optional[str], str]:
         """获取相关知识
 
         Args:
@@ -27,7 +27,7 @@ class KnowledgeFetcher:
             chat_history: 聊天历史
 
         Returns:
-            Tuple[str, str]: (获取的知识, 知识来源)
+            Tuple[Optional[str], str]: (获取的知识, 知识来源)，没有匹配的记忆时知识为None
         """
         # 构建查询上下文
         chat_history_text = ""
@@ -52,4 +52,4 @@ class KnowledgeFetcher:
                 sources.append(f"记忆片段{memory[0]}")
             return knowledge.strip(), "，".join(sources)
 
-        return "未找到相关知识", "无记忆匹配"
+        return None, "无记忆匹配"
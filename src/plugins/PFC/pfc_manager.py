@@ -1,6 +1,9 @@
+import asyncio
+import time
 from typing import Dict, Optional
 from src.common.logger import get_module_logger
 from .conversation import Conversation
+from .chat_observer import ChatObserver
 import traceback
 
 logger = get_module_logger("pfc_manager")
@@ -14,7 +17,13 @@ class PFCManager:
 
     # 会话实例管理
     _instances: Dict[str, Conversation] = {}
-    _initializing: Dict[str, bool] = {}
+    # 每个会话的初始化事件，事件未被设置表示仍在初始化
+    _init_events: Dict[str, asyncio.Event] = {}
+
+    # 空闲实例清理配置
+    idle_timeout: float = 1800.0  # 超过该时间（秒）没有执行行动的会话会被清理
+    sweep_interval: float = 300.0  # 清理检查间隔（秒）
+    _sweeper_task: Optional[asyncio.Task] = None
 
     @classmethod
     def get_instance(cls) -> "PFCManager":
@@ -36,19 +45,26 @@ class PFCManager:
         Returns:
             Optional[Conversation]: 对话实例，创建失败则返回None
         """
+        self._ensure_sweeper()
+
         # 检查是否已经有实例
-        if stream_id in self._initializing and self._initializing[stream_id]:
+        init_event = self._init_events.get(stream_id)
+        if init_event is not None and not init_event.is_set():
             logger.debug(f"会话实例正在初始化中: {stream_id}")
             return None
 
-        if stream_id in self._instances and self._instances[stream_id].should_continue:
-            logger.debug(f"使用现有会话实例: {stream_id}")
-            return self._instances[stream_id]
+        old_instance = self._instances.get(stream_id)
+        if old_instance is not None:
+            if old_instance.should_continue:
+                logger.debug(f"使用现有会话实例: {stream_id}")
+                return old_instance
+            # 已结束的实例先彻底停止，否则其观测信息会一直挂在观察器上
+            await self._stop_instance(old_instance)
 
         try:
             # 创建新实例
             logger.info(f"创建新的对话实例: {stream_id}")
-            self._initializing[stream_id] = True
+            self._init_events[stream_id] = asyncio.Event()
             # 创建实例
             conversation_instance = Conversation(stream_id)
             self._instances[stream_id] = conversation_instance
@@ -75,14 +91,17 @@ class PFCManager:
             await conversation._initialize()
 
             # 标记初始化完成
-            self._initializing[stream_id] = False
+            self._init_events[stream_id].set()
 
             logger.info(f"会话实例 {stream_id} 初始化完成")
 
         except Exception as e:
             logger.error(f"管理器初始化会话实例失败: {stream_id}, 错误: {e}")
             logger.error(traceback.format_exc())
-            # 清理失败的初始化
+            # 清理失败的初始化，下次收到消息时可以重新创建
+            self._instances.pop(stream_id, None)
+            self._init_events.pop(stream_id, None)
+            raise
 
     async def get_conversation(self, stream_id: str) -> Optional[Conversation]:
         """获取已存在的会话实例
@@ -94,3 +113,40 @@ class PFCManager:
             Optional[Conversation]: 会话实例，不存在则返回None
         """
         return self._instances.get(stream_id)
+
+    def _ensure_sweeper(self):
+        """确保空闲实例清理任务正在运行"""
+        if PFCManager._sweeper_task is None or PFCManager._sweeper_task.done():
+            PFCManager._sweeper_task = asyncio.create_task(self._sweep_loop())
+
+    async def _stop_instance(self, conversation: Conversation):
+        """停止会话实例并移除其观察器
+
+        已自行结束的实例同样需要解绑观测信息，观察器移除后该聊天流的消息缓存随之释放
+
+        Args:
+            conversation: 要停止的会话实例
+        """
+        await conversation._stop_conversation()
+        ChatObserver.remove_instance(conversation.stream_id)
+
+    async def _sweep_loop(self):
+        """定期清理已结束或长时间空闲的会话实例"""
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                now = time.monotonic()
+                for stream_id, conversation in list(self._instances.items()):
+                    init_event = self._init_events.get(stream_id)
+                    if init_event is not None and not init_event.is_set():
+                        continue  # 初始化中的实例不清理
+                    if conversation.should_continue and now - conversation.last_activity < self.idle_timeout:
+                        continue
+
+                    logger.info(f"清理已结束或空闲的会话实例: {stream_id}")
+                    await self._stop_instance(conversation)
+                    del self._instances[stream_id]
+                    self._init_events.pop(stream_id, None)
+            except Exception as e:
+                logger.error(f"清理会话实例时出错: {e}")
+                logger.error(traceback.format_exc())
@@ -1,11 +1,203 @@
 import json
 import re
-from typing import Dict, Any, Optional, Tuple, List, Union
+import time
+from functools import lru_cache
+from typing import Dict, Any, Iterable, Optional, Tuple, List, Union, TYPE_CHECKING
 from src.common.logger import get_module_logger
+from src.individuality.individuality import Individuality
+from ..config.config import global_config
+
+if TYPE_CHECKING:
+    from .observation_info import ObservationInfo
+
+try:
+    # orjson为可选依赖，解析更快；它的JSONDecodeError是json.JSONDecodeError的子类，异常处理无需改动
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
 
 logger = get_module_logger("pfc_utils")
 
 
+@lru_cache(maxsize=8)
+def get_personality_prompt(prompt_type: str = "personality", x_person: int = 2, level: int = 2) -> str:
+    """获取人格提示词，同一组参数只向Individuality请求一次
+
+    Args:
+        prompt_type: 提示词类型
+        x_person: 人称
+        level: 详细程度
+
+    Returns:
+        str: 人格提示词
+    """
+    return Individuality.get_instance().get_prompt(type=prompt_type, x_person=x_person, level=level)
+
+
+@lru_cache(maxsize=1)
+def get_personality_text() -> str:
+    """获取各提示词共用的"你的名字是xx，人格"开头
+
+    Returns:
+        str: 拼接好的人格描述
+    """
+    return f"你的名字是{global_config.BOT_NICKNAME}，{get_personality_prompt()}"
+
+
+# 时间戳格式化缓存：整秒 -> "时:分:秒"，同一秒内的消息共用一次格式化结果
+_TS_CACHE: Dict[int, str] = {}
+_MAX_TS_CACHE = 4096
+
+
+def format_hms(timestamp: float) -> str:
+    """将时间戳格式化为"时:分:秒"，按整秒缓存结果
+
+    Args:
+        timestamp: 时间戳
+
+    Returns:
+        str: 本地时间的"%H:%M:%S"格式字符串
+    """
+    second = int(timestamp)
+    result = _TS_CACHE.get(second)
+    if result is None:
+        if len(_TS_CACHE) >= _MAX_TS_CACHE:
+            _TS_CACHE.clear()
+        result = _TS_CACHE[second] = time.strftime("%H:%M:%S", time.localtime(second))
+    return result
+
+
+# 当前时间的单槽缓存：[整秒, "时:分:秒"]，同一秒内只比较一次整数
+_NOW_HMS = [0, ""]
+
+
+def now_hms() -> str:
+    """获取当前本地时间的"时:分:秒"字符串，同一秒内复用上一次的格式化结果
+
+    Returns:
+        str: "%H:%M:%S"格式的当前时间
+    """
+    second = int(time.time())
+    if second != _NOW_HMS[0]:
+        _NOW_HMS[0] = second
+        _NOW_HMS[1] = time.strftime("%H:%M:%S", time.localtime(second))
+    return _NOW_HMS[1]
+
+
+def build_goals_text(goal_list: List[Any]) -> str:
+    """将对话目标列表格式化为提示词文本
+
+    Args:
+        goal_list: 对话目标列表，元素可以是(目标, 原因)元组或包含goal/reasoning的字典
+
+    Returns:
+        str: 每行一个目标的文本
+    """
+    if not goal_list:
+        return "目标：目前没有明确对话目标，产生该对话目标的原因：目前没有明确对话目标，最好思考一个对话目标\n"
+
+    lines = []
+    for goal_reason in goal_list:
+        # 处理字典或元组格式
+        if isinstance(goal_reason, tuple):
+            # 假设元组的第一个元素是目标，第二个元素是原因
+            goal = goal_reason[0]
+            reasoning = goal_reason[1] if len(goal_reason) > 1 else "没有明确原因"
+        elif isinstance(goal_reason, dict):
+            goal = goal_reason.get("goal")
+            reasoning = goal_reason.get("reasoning", "没有明确原因")
+        else:
+            # 如果是其他类型，尝试转为字符串
+            goal = str(goal_reason)
+            reasoning = "没有明确原因"
+        lines.append(f"目标：{goal}，产生该对话目标的原因：{reasoning}\n")
+    return "".join(lines)
+
+
+def build_action_history_text(done_action: Iterable[Any], limit: int = 10) -> str:
+    """将最近的行动记录格式化为提示词文本
+
+    Args:
+        done_action: 行动记录（列表或deque），元素可以是字典或(行动, 原因, 状态)元组
+        limit: 最多包含的行动条数
+
+    Returns:
+        str: 以"你之前做的事情是："开头、以空行结尾的行动历史文本，没有可展示的行动时返回空字符串
+    """
+    lines = []
+    for action in list(done_action)[-limit:]:
+        if isinstance(action, dict):
+            action_type = action.get("action")
+            action_reason = action.get("reason")
+            action_status = action.get("status")
+        elif isinstance(action, tuple):
+            # 假设元组的格式是(action_type, action_reason, action_status)
+            action_type = action[0] if len(action) > 0 else "未知行动"
+            action_reason = action[1] if len(action) > 1 else "未知原因"
+            action_status = action[2] if len(action) > 2 else "done"
+        else:
+            continue
+
+        if action_status == "recall":
+            lines.append(f"原本打算：{action_type}，但是因为有新消息，你发现这个行动不合适，所以你没做\n")
+        elif action_status == "done":
+            lines.append(f"你之前做了：{action_type}，原因：{action_reason}\n")
+
+    if not lines:
+        return ""
+    return "你之前做的事情是：" + "".join(lines) + "\n"
+
+
+def truncate_history(lines: List[str], max_chars: int = 1600) -> List[str]:
+    """从最新的一行往前保留聊天记录，直到总字数达到上限
+
+    Args:
+        lines: 按时间正序排列的聊天记录行
+        max_chars: 字数上限，最新的一行总会被保留
+
+    Returns:
+        List[str]: 保留下来的聊天记录行，仍按时间正序排列
+    """
+    kept = 0
+    total = 0
+    for line in reversed(lines):
+        total += len(line)
+        if kept and total > max_chars:
+            break
+        kept += 1
+    return lines[len(lines) - kept :]
+
+
+def build_chat_history_text(observation_info: "ObservationInfo", limit: int = 20, max_chars: int = 1600) -> str:
+    """将已读聊天记录和新消息格式化为提示词文本
+
+    新消息总会完整保留并被标注出来，格式化后标记为已处理；
+    已读记录从新到旧保留，与新消息合计不超过字数上限
+
+    Args:
+        observation_info: 观察信息
+        limit: 最多包含的已读消息条数
+        max_chars: 聊天记录的字数上限
+
+    Returns:
+        str: 聊天记录文本
+    """
+    history_lines = [
+        line
+        for line in (msg.get("detailed_plain_text", "").strip() for msg in observation_info.chat_history[-limit:])
+        if line
+    ]
+
+    new_lines = []
+    if observation_info.new_messages_count > 0:
+        new_lines.append(f"有{observation_info.new_messages_count}条新消息：")
+        new_lines.extend(msg.get("detailed_plain_text", "").strip() for msg in observation_info.unprocessed_messages)
+        observation_info.clear_unprocessed_messages()
+
+    budget = max(max_chars - sum(len(line) for line in new_lines), 0)
+    return "\n".join(truncate_history(history_lines, budget) + new_lines)
+
+
 def get_items_from_json(
     content: str,
     *items: str,
@@ -40,7 +232,7 @@ def get_items_from_json(
             array_match = re.search(array_pattern, content)
             if array_match:
                 array_content = array_match.group()
-                json_array = json.loads(array_content)
+                json_array = json_loads(array_content)
 
                 # 确认是数组类型
                 if isinstance(json_array, list):
@@ -84,14 +276,14 @@ def get_items_from_json(
 
     # 尝试解析JSON对象
     try:
-        json_data = json.loads(content)
+        json_data = json_loads(content)
     except json.JSONDecodeError:
         # 如果直接解析失败，尝试查找和提取JSON部分
         json_pattern = r"\{[^{}]*\}"
         json_match = re.search(json_pattern, content)
         if json_match:
             try:
-                json_data = json.loads(json_match.group())
+                json_data = json_loads(json_match.group())
             except json.JSONDecodeError:
                 logger.error("提取的JSON内容解析失败")
                 return False, result
@@ -1,11 +1,11 @@
 import json
-import datetime
 from typing import Tuple
 from src.common.logger import get_module_logger
 from ..models.utils_model import LLM_request
 from ..config.config import global_config
 from .chat_observer import ChatObserver
-from ..message.message_base import UserInfo
+from .llm_batcher import LLMBatcher
+from .pfc_utils import json_loads
 
 logger = get_module_logger("reply_checker")
 
@@ -33,15 +33,7 @@ class ReplyChecker:
             Tuple[bool, str, bool]: (是否合适, 原因, 是否需要重新规划)
         """
         # 获取最新的消息记录
-        messages = self.chat_observer.get_cached_messages(limit=5)
-        chat_history_text = ""
-        for msg in messages:
-            time_str = datetime.datetime.fromtimestamp(msg["time"]).strftime("%H:%M:%S")
-            user_info = UserInfo.from_dict(msg.get("user_info", {}))
-            sender = user_info.user_nickname or f"用户{user_info.user_id}"
-            if sender == self.name:
-                sender = "你说"
-            chat_history_text += f"{time_str},{sender}:{msg.get('processed_plain_text', '')}\n"
+        chat_history_text = self.chat_observer.get_rendered_history(limit=5)
 
         prompt = f"""请检查以下回复是否合适：
 
@@ -74,14 +66,14 @@ class ReplyChecker:
 注意：请严格按照JSON格式输出，不要包含任何其他内容。"""
 
         try:
-            content, _ = await self.llm.generate_response_async(prompt)
-            logger.debug(f"检查回复的原始返回: {content}")
+            content, _ = await LLMBatcher.get_instance().submit(self.llm, prompt)
+            logger.debug("检查回复的原始返回: {}", content)
 
             # 清理内容，尝试提取JSON部分
             content = content.strip()
             try:
                 # 尝试直接解析
-                result = json.loads(content)
+                result = json_loads(content)
             except json.JSONDecodeError:
                 # 如果直接解析失败，尝试查找和提取JSON部分
                 import re
@@ -90,7 +82,7 @@ class ReplyChecker:
                 json_match = re.search(json_pattern, content)
                 if json_match:
                     try:
-                        result = json.loads(json_match.group())
+                        result = json_loads(json_match.group())
                     except json.JSONDecodeError:
                         # 如果JSON解析失败，尝试从文本中提取结果
                         is_suitable = "不合适" not in content.lower() and "违规" not in content.lower()
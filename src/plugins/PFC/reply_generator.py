@@ -1,15 +1,36 @@
-from typing import Tuple
+from typing import AsyncIterator, Callable, Optional, Tuple
 from src.common.logger import get_module_logger
 from ..models.utils_model import LLM_request
 from ..config.config import global_config
 from .chat_observer import ChatObserver
+from .llm_batcher import LLMBatcher
 from .reply_checker import ReplyChecker
-from src.individuality.individuality import Individuality
+from .pfc_utils import build_goals_text, build_chat_history_text, get_personality_prompt, get_personality_text
 from .observation_info import ObservationInfo
 from .conversation_info import ConversationInfo
 
 logger = get_module_logger("reply_generator")
 
+_REPLY_PROMPT = """{personality}。现在你在参与一场QQ聊天，请根据以下信息生成回复：
+
+当前对话目标：{goals}
+最近的聊天记录：
+{chat_history}
+
+
+请根据上述信息，以你的性格特征生成一个自然、得体的回复。回复应该：
+1. 符合对话目标，以"你"的角度发言
+2. 体现你的性格特征
+3. 自然流畅，像正常聊天一样，简短
+4. 适当利用相关知识，但不要生硬引用
+
+请注意把握聊天内容，不要回复的太有条理，可以有个性。请分清"你"和对方说的话，不要把"你"说的话当做对方说的话，这是你自己说的话。
+请你回复的平淡一些，简短一些，说中文，不要刻意突出自身学科背景，尽量不要说你说过的话 
+请你注意不要输出多余内容(包括前后缀，冒号和引号，括号，表情等)，只输出回复内容。
+不要输出多余内容(包括前后缀，冒号和引号，括号，表情包，at或 @等 )。
+
+请直接输出回复内容，不需要任何额外格式。"""
+
 
 class ReplyGenerator:
     """回复生成器"""
@@ -21,141 +42,74 @@ class ReplyGenerator:
             max_tokens=300,
             request_type="reply_generation",
         )
-        self.personality_info = Individuality.get_instance().get_prompt(type="personality", x_person=2, level=2)
+        self.personality_info = get_personality_prompt()
         self.name = global_config.BOT_NICKNAME
+        self.personality_text = get_personality_text()
         self.chat_observer = ChatObserver.get_instance(stream_id)
         self.reply_checker = ReplyChecker(stream_id)
 
-    async def generate(self, observation_info: ObservationInfo, conversation_info: ConversationInfo) -> str:
-        """生成回复
-
-        Args:
-            goal: 对话目标
-            chat_history: 聊天历史
-            knowledge_cache: 知识缓存
-            previous_reply: 上一次生成的回复（如果有）
-            retry_count: 当前重试次数
-
-        Returns:
-            str: 生成的回复
-        """
-        # 构建提示词
-        logger.debug(f"开始生成回复：当前目标: {conversation_info.goal_list}")
-
-        # 构建对话目标
-        goals_str = ""
-        if conversation_info.goal_list:
-            for goal_reason in conversation_info.goal_list:
-                # 处理字典或元组格式
-                if isinstance(goal_reason, tuple):
-                    # 假设元组的第一个元素是目标，第二个元素是原因
-                    goal = goal_reason[0]
-                    reasoning = goal_reason[1] if len(goal_reason) > 1 else "没有明确原因"
-                elif isinstance(goal_reason, dict):
-                    goal = goal_reason.get("goal")
-                    reasoning = goal_reason.get("reasoning", "没有明确原因")
-                else:
-                    # 如果是其他类型，尝试转为字符串
-                    goal = str(goal_reason)
-                    reasoning = "没有明确原因"
-
-                goal_str = f"目标：{goal}，产生该对话目标的原因：{reasoning}\n"
-                goals_str += goal_str
-        else:
-            goal = "目前没有明确对话目标"
-            reasoning = "目前没有明确对话目标，最好思考一个对话目标"
-            goals_str = f"目标：{goal}，产生该对话目标的原因：{reasoning}\n"
-
-        # 获取聊天历史记录
-        chat_history_list = (
-            observation_info.chat_history[-20:]
-            if len(observation_info.chat_history) >= 20
-            else observation_info.chat_history
-        )
-        chat_history_text = ""
-        for msg in chat_history_list:
-            chat_history_text += f"{msg.get('detailed_plain_text', '')}\n"
-
-        if observation_info.new_messages_count > 0:
-            new_messages_list = observation_info.unprocessed_messages
-
-            chat_history_text += f"有{observation_info.new_messages_count}条新消息：\n"
-            for msg in new_messages_list:
-                chat_history_text += f"{msg.get('detailed_plain_text', '')}\n"
-
-            observation_info.clear_unprocessed_messages()
-
-        personality_text = f"你的名字是{self.name}，{self.personality_info}"
-
-        # 构建action历史文本
-        action_history_list = (
-            conversation_info.done_action[-10:]
-            if len(conversation_info.done_action) >= 10
-            else conversation_info.done_action
+    def _build_prompt(self, observation_info: ObservationInfo, conversation_info: ConversationInfo) -> str:
+        """构建回复提示词"""
+        return _REPLY_PROMPT.format(
+            personality=self.personality_text,
+            goals=build_goals_text(conversation_info.goal_list),
+            chat_history=build_chat_history_text(observation_info),
         )
-        action_history_text = "你之前做的事情是："
-        for action in action_history_list:
-            if isinstance(action, dict):
-                action_type = action.get("action")
-                action_reason = action.get("reason")
-                action_status = action.get("status")
-                if action_status == "recall":
-                    action_history_text += (
-                        f"原本打算：{action_type}，但是因为有新消息，你发现这个行动不合适，所以你没做\n"
-                    )
-                elif action_status == "done":
-                    action_history_text += f"你之前做了：{action_type}，原因：{action_reason}\n"
-            elif isinstance(action, tuple):
-                # 假设元组的格式是(action_type, action_reason, action_status)
-                action_type = action[0] if len(action) > 0 else "未知行动"
-                action_reason = action[1] if len(action) > 1 else "未知原因"
-                action_status = action[2] if len(action) > 2 else "done"
-                if action_status == "recall":
-                    action_history_text += (
-                        f"原本打算：{action_type}，但是因为有新消息，你发现这个行动不合适，所以你没做\n"
-                    )
-                elif action_status == "done":
-                    action_history_text += f"你之前做了：{action_type}，原因：{action_reason}\n"
-
-        prompt = f"""{personality_text}。现在你在参与一场QQ聊天，请根据以下信息生成回复：
-
-当前对话目标：{goals_str}
-最近的聊天记录：
-{chat_history_text}
 
+    async def generate_stream(
+        self, observation_info: ObservationInfo, conversation_info: ConversationInfo
+    ) -> AsyncIterator[str]:
+        """流式生成回复，逐段产出模型输出
 
-请根据上述信息，以你的性格特征生成一个自然、得体的回复。回复应该：
-1. 符合对话目标，以"你"的角度发言
-2. 体现你的性格特征
-3. 自然流畅，像正常聊天一样，简短
-4. 适当利用相关知识，但不要生硬引用
+        Args:
+            observation_info: 观察信息
+            conversation_info: 对话信息
+        """
+        logger.debug("开始生成回复：当前目标: {}", conversation_info.goal_list)
+        prompt = self._build_prompt(observation_info, conversation_info)
 
-请注意把握聊天内容，不要回复的太有条理，可以有个性。请分清"你"和对方说的话，不要把"你"说的话当做对方说的话，这是你自己说的话。
-请你回复的平淡一些，简短一些，说中文，不要刻意突出自身学科背景，尽量不要说你说过的话 
-请你注意不要输出多余内容(包括前后缀，冒号和引号，括号，表情等)，只输出回复内容。
-不要输出多余内容(包括前后缀，冒号和引号，括号，表情包，at或 @等 )。
+        stream = LLMBatcher.get_instance().stream(self.llm, prompt)
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    async def generate(
+        self,
+        observation_info: ObservationInfo,
+        conversation_info: ConversationInfo,
+        should_abort: Optional[Callable[[], bool]] = None,
+    ) -> Optional[str]:
+        """生成回复
 
-请直接输出回复内容，不需要任何额外格式。"""
+        Args:
+            observation_info: 观察信息
+            conversation_info: 对话信息
+            should_abort: 每收到一段输出时调用，返回True则放弃本次生成
 
+        Returns:
+            Optional[str]: 生成的回复，生成过程中被放弃时返回None
+        """
+        stream = self.generate_stream(observation_info, conversation_info)
         try:
-            content, _ = await self.llm.generate_response_async(prompt)
-            logger.info(f"生成的回复: {content}")
-            # is_new = self.chat_observer.check()
-            # logger.debug(f"再看一眼聊天记录，{'有' if is_new else '没有'}新消息")
-
-            # 如果有新消息,重新生成回复
-            # if is_new:
-            #     logger.info("检测到新消息,重新生成回复")
-            #     return await self.generate(
-            #         goal, chat_history, knowledge_cache,
-            #         None, retry_count
-            #     )
-
+            chunks = []
+            async for chunk in stream:
+                if should_abort is not None and should_abort():
+                    logger.info("生成回复时出现新情况，放弃本次生成")
+                    return None
+                chunks.append(chunk)
+
+            # 与普通请求的响应处理一致，去掉思维链（包括没有开始标签的</think>）
+            content, _ = LLM_request._extract_reasoning("".join(chunks))
+            logger.info("生成的回复: {}", content)
             return content
 
         except Exception as e:
             logger.error(f"生成回复时出错: {e}")
             return "抱歉，我现在有点混乱，让我重新思考一下..."
+        finally:
+            await stream.aclose()
 
     async def check_reply(self, reply: str, goal: str, retry_count: int = 0) -> Tuple[bool, str, bool]:
         """检查回复是否合适
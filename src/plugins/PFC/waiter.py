@@ -1,10 +1,9 @@
 from src.common.logger import get_module_logger
 from .chat_observer import ChatObserver
 from .conversation_info import ConversationInfo
-from src.individuality.individuality import Individuality
+from .pfc_utils import get_personality_prompt
 from ..config.config import global_config
 import time
-import asyncio
 
 logger = get_module_logger("waiter")
 
@@ -14,10 +13,11 @@ class Waiter:
 
     def __init__(self, stream_id: str):
         self.chat_observer = ChatObserver.get_instance(stream_id)
-        self.personality_info = Individuality.get_instance().get_prompt(type="personality", x_person=2, level=2)
+        self.personality_info = get_personality_prompt()
         self.name = global_config.BOT_NICKNAME
 
         self.wait_accumulated_time = 0
+        self.wait_timeout = 300  # 单次等待的超时时间（秒）
 
     async def wait(self, conversation_info: ConversationInfo) -> bool:
         """等待
@@ -25,35 +25,22 @@ class Waiter:
         Returns:
             bool: 是否超时（True表示超时）
         """
-        # 使用当前时间作为等待开始时间
-        wait_start_time = time.time()
-        self.chat_observer.waiting_start_time = wait_start_time  # 设置等待开始时间
-
-        while True:
-            # 检查是否有新消息
-            if self.chat_observer.new_message_after(wait_start_time):
-                logger.info("等待结束，收到新消息")
-                return False
+        return await self._wait_for_new_message(conversation_info, "对方很久没有回复你的消息了")
 
-            # 检查是否超时
-            if time.time() - wait_start_time > 300:
-                self.wait_accumulated_time += 300
-
-                logger.info("等待超过300秒，结束对话")
-                wait_goal = {
-                    "goal": f"你等待了{self.wait_accumulated_time / 60}分钟，思考接下来要做什么",
-                    "reason": "对方很久没有回复你的消息了",
-                }
-                conversation_info.goal_list.append(wait_goal)
-                print(f"添加目标: {wait_goal}")
+    async def wait_listening(self, conversation_info: ConversationInfo) -> bool:
+        """等待倾听
 
-                return True
+        Returns:
+            bool: 是否超时（True表示超时）
+        """
+        return await self._wait_for_new_message(conversation_info, "对方话说一半消失了，很久没有回复")
 
-            await asyncio.sleep(1)
-            logger.info("等待中...")
+    async def _wait_for_new_message(self, conversation_info: ConversationInfo, timeout_reason: str) -> bool:
+        """等待新消息，超时则添加一个新的对话目标
 
-    async def wait_listening(self, conversation_info: ConversationInfo) -> bool:
-        """等待倾听
+        Args:
+            conversation_info: 对话信息
+            timeout_reason: 超时后添加的目标的原因
 
         Returns:
             bool: 是否超时（True表示超时）
@@ -62,24 +49,18 @@ class Waiter:
         wait_start_time = time.time()
         self.chat_observer.waiting_start_time = wait_start_time  # 设置等待开始时间
 
-        while True:
-            # 检查是否有新消息
-            if self.chat_observer.new_message_after(wait_start_time):
-                logger.info("等待结束，收到新消息")
-                return False
-
-            # 检查是否超时
-            if time.time() - wait_start_time > 300:
-                self.wait_accumulated_time += 300
-                logger.info("等待超过300秒，结束对话")
-                wait_goal = {
-                    "goal": f"你等待了{self.wait_accumulated_time / 60}分钟，思考接下来要做什么",
-                    "reason": "对方话说一半消失了，很久没有回复",
-                }
-                conversation_info.goal_list.append(wait_goal)
-                print(f"添加目标: {wait_goal}")
-
-                return True
-
-            await asyncio.sleep(1)
-            logger.info("等待中...")
+        logger.info("等待中...")
+        if await self.chat_observer.wait_new_message(wait_start_time, timeout=self.wait_timeout):
+            logger.info("等待结束，收到新消息")
+            return False
+
+        self.wait_accumulated_time += self.wait_timeout
+        logger.info(f"等待超过{self.wait_timeout}秒，结束对话")
+        wait_goal = {
+            "goal": f"你等待了{self.wait_accumulated_time / 60}分钟，思考接下来要做什么",
+            "reason": timeout_reason,
+        }
+        conversation_info.goal_list.append(wait_goal)
+        print(f"添加目标: {wait_goal}")
+
+        return True
@@ -322,9 +322,20 @@ class MessageSending(MessageProcessBase):
             )
         return self
 
+    def is_pure_text(self) -> bool:
+        """消息是否只由一个文本片段组成"""
+        return self.message_segment is not None and self.message_segment.type == "text"
+
+    def process_pure_text(self) -> None:
+        """纯文本消息的快速处理，无需逐段转换，直接以原文作为纯文本"""
+        self.processed_plain_text = self.message_segment.data
+        self.detailed_plain_text = self._generate_detailed_text()
+
     async def process(self) -> None:
         """处理消息内容，生成纯文本和详细文本"""
-        if self.message_segment:
+        if self.is_pure_text():
+            self.process_pure_text()
+        elif self.message_segment:
             self.processed_plain_text = await self._process_message_segments(self.message_segment)
             self.detailed_plain_text = self._generate_detailed_text()
 
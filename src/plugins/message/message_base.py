@@ -2,10 +2,12 @@ from dataclasses import dataclass, asdict
 from typing import List, Optional, Union, Dict
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Seg:
     """消息片段类，用于表示消息的不同部分
 
+    片段创建后不可修改，使用__slots__减少每条消息的构造开销和内存占用
+
     Attributes:
         type: 片段类型，可以是 'text'、'image'、'seglist' 等
         data: 片段的具体内容
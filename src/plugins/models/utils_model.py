@@ -2,7 +2,7 @@ import asyncio
 import json
 import re
 from datetime import datetime
-from typing import Tuple, Union
+from typing import AsyncIterator, Tuple, Union
 
 import aiohttp
 from src.common.logger import get_module_logger
@@ -296,88 +296,80 @@ class LLM_request:
                                 accumulated_content = ""
                                 usage = None  # 初始化usage变量，避免未定义错误
 
-                                async for line_bytes in response.content:
-                                    try:
-                                        line = line_bytes.decode("utf-8").strip()
-                                        if not line:
-                                            continue
-                                        if line.startswith("data:"):
-                                            data_str = line[5:].strip()
-                                            if data_str == "[DONE]":
-                                                break
-                                            try:
-                                                chunk = json.loads(data_str)
-                                                if flag_delta_content_finished:
+                                try:
+                                    async for chunk in self._iter_stream_chunks(response):
+                                        try:
+                                            if flag_delta_content_finished:
+                                                chunk_usage = chunk.get("usage", None)
+                                                if chunk_usage:
+                                                    usage = chunk_usage  # 获取token用量
+                                            else:
+                                                delta = chunk["choices"][0]["delta"]
+                                                delta_content = delta.get("content")
+                                                if delta_content is None:
+                                                    delta_content = ""
+                                                accumulated_content += delta_content
+                                                # 检测流式输出文本是否结束
+                                                finish_reason = chunk["choices"][0].get("finish_reason")
+                                                if delta.get("reasoning_content", None):
+                                                    reasoning_content += delta["reasoning_content"]
+                                                if finish_reason == "stop":
                                                     chunk_usage = chunk.get("usage", None)
                                                     if chunk_usage:
-                                                        usage = chunk_usage  # 获取token用量
-                                                else:
-                                                    delta = chunk["choices"][0]["delta"]
-                                                    delta_content = delta.get("content")
-                                                    if delta_content is None:
-                                                        delta_content = ""
-                                                    accumulated_content += delta_content
-                                                    # 检测流式输出文本是否结束
-                                                    finish_reason = chunk["choices"][0].get("finish_reason")
-                                                    if delta.get("reasoning_content", None):
-                                                        reasoning_content += delta["reasoning_content"]
-                                                    if finish_reason == "stop":
-                                                        chunk_usage = chunk.get("usage", None)
-                                                        if chunk_usage:
-                                                            usage = chunk_usage
-                                                            break
-                                                        # 部分平台在文本输出结束前不会返回token用量，此时需要再获取一次chunk
-                                                        flag_delta_content_finished = True
-
-                                            except Exception as e:
-                                                logger.exception(f"模型 {self.model_name} 解析流式输出错误: {str(e)}")
-                                    except GeneratorExit:
-                                        logger.warning("模型 {self.model_name} 流式输出被中断，正在清理资源...")
-                                        # 确保资源被正确清理
-                                        await response.release()
-                                        # 返回已经累积的内容
-                                        result = {
-                                            "choices": [
-                                                {
-                                                    "message": {
-                                                        "content": accumulated_content,
-                                                        "reasoning_content": reasoning_content,
-                                                        # 流式输出可能没有工具调用，此处不需要添加tool_calls字段
-                                                    }
+                                                        usage = chunk_usage
+                                                        break
+                                                    # 部分平台在文本输出结束前不会返回token用量，此时需要再获取一次chunk
+                                                    flag_delta_content_finished = True
+
+                                        except Exception as e:
+                                            logger.exception(f"模型 {self.model_name} 解析流式输出错误: {str(e)}")
+                                except GeneratorExit:
+                                    logger.warning("模型 {self.model_name} 流式输出被中断，正在清理资源...")
+                                    # 确保资源被正确清理
+                                    await response.release()
+                                    # 返回已经累积的内容
+                                    result = {
+                                        "choices": [
+                                            {
+                                                "message": {
+                                                    "content": accumulated_content,
+                                                    "reasoning_content": reasoning_content,
+                                                    # 流式输出可能没有工具调用，此处不需要添加tool_calls字段
                                                 }
-                                            ],
-                                            "usage": usage,
-                                        }
-                                        return (
-                                            response_handler(result)
-                                            if response_handler
-                                            else self._default_response_handler(result, user_id, request_type, endpoint)
-                                        )
-                                    except Exception as e:
-                                        logger.error(f"模型 {self.model_name} 处理流式输出时发生错误: {str(e)}")
-                                        # 确保在发生错误时也能正确清理资源
-                                        try:
-                                            await response.release()
-                                        except Exception as cleanup_error:
-                                            logger.error(f"清理资源时发生错误: {cleanup_error}")
-                                        # 返回已经累积的内容
-                                        result = {
-                                            "choices": [
-                                                {
-                                                    "message": {
-                                                        "content": accumulated_content,
-                                                        "reasoning_content": reasoning_content,
-                                                        # 流式输出可能没有工具调用，此处不需要添加tool_calls字段
-                                                    }
+                                            }
+                                        ],
+                                        "usage": usage,
+                                    }
+                                    return (
+                                        response_handler(result)
+                                        if response_handler
+                                        else self._default_response_handler(result, user_id, request_type, endpoint)
+                                    )
+                                except Exception as e:
+                                    logger.error(f"模型 {self.model_name} 处理流式输出时发生错误: {str(e)}")
+                                    # 确保在发生错误时也能正确清理资源
+                                    try:
+                                        await response.release()
+                                    except Exception as cleanup_error:
+                                        logger.error(f"清理资源时发生错误: {cleanup_error}")
+                                    # 返回已经累积的内容
+                                    result = {
+                                        "choices": [
+                                            {
+                                                "message": {
+                                                    "content": accumulated_content,
+                                                    "reasoning_content": reasoning_content,
+                                                    # 流式输出可能没有工具调用，此处不需要添加tool_calls字段
                                                 }
-                                            ],
-                                            "usage": usage,
-                                        }
-                                        return (
-                                            response_handler(result)
-                                            if response_handler
-                                            else self._default_response_handler(result, user_id, request_type, endpoint)
-                                        )
+                                            }
+                                        ],
+                                        "usage": usage,
+                                    }
+                                    return (
+                                        response_handler(result)
+                                        if response_handler
+                                        else self._default_response_handler(result, user_id, request_type, endpoint)
+                                    )
                                 content = accumulated_content
                                 think_match = re.search(r"<think>(.*?)</think>", content, re.DOTALL)
                                 if think_match:
@@ -510,6 +502,23 @@ class LLM_request:
         logger.error(f"模型 {self.model_name} 达到最大重试次数，请求仍然失败")
         raise RuntimeError(f"模型 {self.model_name} 达到最大重试次数，API请求仍然失败")
 
+    async def _iter_stream_chunks(self, response: aiohttp.ClientResponse) -> AsyncIterator[dict]:
+        """逐个产出SSE流式响应中的数据块
+
+        遇到[DONE]时结束，无法解析的数据行记录错误后跳过，不中断整个流。
+        """
+        async for line_bytes in response.content:
+            line = line_bytes.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            data_str = line[5:].strip()
+            if data_str == "[DONE]":
+                return
+            try:
+                yield json.loads(data_str)
+            except json.JSONDecodeError as e:
+                logger.exception(f"模型 {self.model_name} 解析流式输出错误: {str(e)}")
+
     async def _transform_parameters(self, params: dict) -> dict:
         """
         根据模型名称转换参数：
@@ -661,6 +670,60 @@ class LLM_request:
         # 原样返回响应，不做处理
         return response
 
+    async def stream_response_async(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """异步方式流式生成响应，逐段产出模型输出的原始文本（可能包含思维链标签）
+
+        模型未开启流式输出、服务端返回错误码，或者在产出任何内容之前请求失败时，
+        退回到generate_response_async，由它按重试策略处理并一次性产出完整回复。
+        已有输出后连接中断时记录错误并保留已产出的内容。
+        调用方提前结束迭代时会关闭连接，模型不再继续生成。
+        """
+        if not self.stream:
+            content, *_ = await self.generate_response_async(prompt, **kwargs)
+            yield content
+            return
+
+        payload = await self._build_payload(prompt)
+        payload.update(await self._transform_parameters(kwargs))
+        payload["stream"] = True
+        api_url = f"{self.base_url.rstrip('/')}/chat/completions"
+        headers = await self._build_headers()
+        headers["Accept"] = "text/event-stream"
+
+        usage = None
+        has_output = False
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(api_url, headers=headers, json=payload) as response:
+                    if response.status == 200:
+                        async for chunk in self._iter_stream_chunks(response):
+                            if chunk.get("usage"):
+                                usage = chunk["usage"]
+                            if not chunk.get("choices"):
+                                continue
+                            delta_content = chunk["choices"][0].get("delta", {}).get("content")
+                            if delta_content:
+                                has_output = True
+                                yield delta_content
+
+                        if usage:
+                            self._record_usage(
+                                prompt_tokens=usage.get("prompt_tokens", 0),
+                                completion_tokens=usage.get("completion_tokens", 0),
+                                total_tokens=usage.get("total_tokens", 0),
+                            )
+                        return
+
+                    logger.warning(f"模型 {self.model_name} 流式请求错误码: {response.status}，改用普通请求")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if has_output:
+                logger.error(f"模型 {self.model_name} 流式输出中断，保留已收到的内容: {str(e)}")
+                return
+            logger.warning(f"模型 {self.model_name} 流式请求失败，改用普通请求: {str(e)}")
+
+        content, *_ = await self.generate_response_async(prompt, **kwargs)
+        yield content
+
     async def get_embedding(self, text: str) -> Union[list, None]:
         """异步方法：获取文本的embedding向量
 